@@ -12,16 +12,37 @@
 """
 #See also: https://github.com/localdevices/odk2odm/blob/main/odk2odm/odm_requests.py
 
+import concurrent.futures
 import json
 import os
 import re
 import pathlib
 import shutil
+import time
 import zipfile
 from slugify import slugify
 import requests
+from requests.adapters import HTTPAdapter, Retry
 from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 
+#Shared session for all API calls
+#Re-uses pooled connections (keep-alive) rather than paying a
+#TCP+TLS handshake on every request
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])))
+
+#Use orjson for parsing large API responses if available
+try:
+    import orjson as _json
+except (ImportError) as e:
+    _json = json
+
+def _parse_json(r):
+    #Parse a response body directly from the raw bytes, skipping the
+    #charset detection and intermediate string that r.json() goes through
+    return _json.loads(r.content)
+
 # This is the server process launched by installed entrypoint
 # Whenever request is made on (jupyterhub_url)/asdc this server is started
 # if not running, then processes the request
@@ -44,8 +65,51 @@ auth.authenticate()
 
 project_dir = os.path.join(os.getenv('JUPYTER_SERVER_ROOT', '/home/jovyan/'), 'projects')
 
+#Default transfer chunk size, larger chunks = fewer python-level iterations
+#(8k chunks measurably slow down large asset transfers)
+DEFAULT_CHUNK_SIZE = 1048576 #1MiB
+
+#The environment doesn't change after import, detect once
+_IS_NOTEBOOK = is_notebook()
+
+#Token prefix from settings, looked up once
+#(also the default for the prefix= parameters below)
+_TOKEN_PREFIX = auth.settings["token_prefix"]
+
+#Select the notebook or console progress bar once at import
+#(guarded so the module still loads without tqdm installed)
+try:
+    if _IS_NOTEBOOK:
+        from tqdm.notebook import tqdm as _tqdm
+    else:
+        from tqdm import tqdm as _tqdm
+except (ImportError) as e:
+    _tqdm = None
+
+#Cached Authorization header key, so the header string is only
+#rebuilt and set on the session when the token or prefix changes
+_auth_header = {"key": None}
+
+def _refresh_auth_header(prefix):
+    """
+    Ensure the shared session carries a current Authorization header
+
+    Rebuilds the header string only when the access token or prefix changes,
+    instead of concatenating it on every request.
+    """
+    if auth.cookies:
+        #Cookie auth active - drop any stale bearer header from the session
+        #so it isn't sent alongside the cookies
+        _session.headers.pop('Authorization', None)
+        _auth_header["key"] = None
+        return
+    access_token = auth.get_token()
+    if (prefix, access_token) != _auth_header["key"]:
+        _auth_header["key"] = (prefix, access_token)
+        _session.headers['Authorization'] = f'{prefix} {access_token}'
+
 #Utility functions
-def call_api(url, data=None, headersAPI=None, content_type='application/json', throw=True, prefix=auth.settings["token_prefix"]):
+def call_api(url, data=None, headersAPI=None, content_type='application/json', throw=True, prefix=_TOKEN_PREFIX):
     """
     Call an API endpoint
 
@@ -63,7 +127,7 @@ def call_api(url, data=None, headersAPI=None, content_type='application/json', t
     object
         http response object
     """
-    if url[0:4] != "http":
+    if not url.startswith(("http://", "https://")):
         #Prepend the configured api url
         url = auth.settings["api_audience"] + url
 
@@ -73,15 +137,17 @@ def call_api(url, data=None, headersAPI=None, content_type='application/json', t
         'accept': 'application/json',
         'Content-type': content_type,
         }
-        if not auth.cookies:
-            access_token = auth.get_token()
-            headersAPI['Authorization'] = prefix + ' ' + access_token
-    
+        _refresh_auth_header(prefix)
+    elif 'Authorization' not in headersAPI:
+        #Custom headers never carried auth - a None value tells requests to
+        #omit the session-level Authorization header for this call
+        headersAPI = dict(headersAPI, Authorization=None)
+
     #POST if data provided, otherwise GET
     if data:
-        r = requests.post(url, headers=headersAPI, json=data, cookies=auth.cookies)
+        r = _session.post(url, headers=headersAPI, json=data, cookies=auth.cookies)
     else:
-        r = requests.get(url, headers=headersAPI, cookies=auth.cookies)
+        r = _session.get(url, headers=headersAPI, cookies=auth.cookies)
     
     #Note: if response is 403 Forbidden {'detail': 'Username not available'}
     # this is because the user hasn't logged in to the main site yet with this auth method
@@ -93,7 +159,7 @@ def call_api(url, data=None, headersAPI=None, content_type='application/json', t
     #print(r.text)
     return r
 
-def download(url, filename=None, block_size=8192, data=None, overwrite=False, throw=False, progress=True, silent=False, prefix=auth.settings["token_prefix"]):
+def download(url, filename=None, block_size=DEFAULT_CHUNK_SIZE, data=None, overwrite=False, throw=False, progress=True, silent=False, prefix=_TOKEN_PREFIX):
     """
     Call an API endpoint to download a file
 
@@ -104,7 +170,7 @@ def download(url, filename=None, block_size=8192, data=None, overwrite=False, th
     filename: str
         local filename, if not provided will use the filename from the url
     block_size: int
-        size of chunks to download
+        size of chunks to download, default 1MiB
     throw: bool
         throw exception on http errors, default: False
     progress: bool
@@ -115,7 +181,7 @@ def download(url, filename=None, block_size=8192, data=None, overwrite=False, th
     str
         local filename saved
     """
-    if url[0:4] != "http":
+    if not url.startswith(("http://", "https://")):
         #Prepend the configured api url
         url = auth.settings["api_audience"] + url
 
@@ -124,32 +190,26 @@ def download(url, filename=None, block_size=8192, data=None, overwrite=False, th
     'accept': 'application/json',
     'Content-type': 'application/octet-stream',
     }
-    if not auth.cookies:
-        access_token = auth.get_token()
-        headersAPI['Authorization'] = prefix + ' ' + access_token
+    _refresh_auth_header(prefix)
 
     if filename is None:
         filename = url.split('/')[-1]
 
     if not overwrite and os.path.exists(filename):
-        if not silent: print("File exists: " + filename)
+        if not silent: print(f"File exists: {filename}")
         return filename
 
     #Progress bar
-    if progress:
-        if is_notebook():
-            from tqdm.notebook import tqdm
-        else:
-            from tqdm import tqdm
+    if progress and _tqdm is None:
+        progress = False
 
     # NOTE the stream=True parameter below
     #https://stackoverflow.com/a/16696317
     #POST if data provided, otherwise GET
     if data:
-        r = requests.post(url, headers=headersAPI, json=data, stream=True, cookies=auth.cookies)
+        r = _session.post(url, headers=headersAPI, json=data, stream=True, cookies=auth.cookies)
     else:
-        r = requests.get(url, headers=headersAPI, stream=True, cookies=auth.cookies)
-    #with requests.get(url, headers=headersAPI, stream=True) as r:
+        r = _session.get(url, headers=headersAPI, stream=True, cookies=auth.cookies)
     if not r.ok:
         if not silent: print("Error response:", r, url)
         return None
@@ -157,18 +217,40 @@ def download(url, filename=None, block_size=8192, data=None, overwrite=False, th
         total_size_in_bytes= int(r.headers.get('content-length', 0))
         got_bytes = 0
         if progress:
-            progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True, leave=False)
+            if total_size_in_bytes > 0:
+                #Cap refreshes at ~200 per download regardless of file size
+                miniters = max(1, total_size_in_bytes // (block_size * 200))
+                progress_bar = _tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True, leave=False, miniters=miniters)
+            else:
+                #Unknown length (chunked transfer), omit total so tqdm
+                #skips the rate/ETA maths against a zero total
+                progress_bar = _tqdm(unit='iB', unit_scale=True, leave=False)
         r.raise_for_status()
-        with open(filename, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=block_size):
-                got_bytes += len(chunk)
-                if progress:
-                    progress_bar.update(len(chunk))
-                # If you have chunk encoded response uncomment if
-                # and set chunk_size parameter to None.
-                #if chunk:
-                f.write(chunk)
-        if progress:
+        if not progress:
+            #Fast path: no per-chunk feedback needed, copy the raw stream
+            #in C via shutil and skip the python-level chunk loop entirely
+            r.raw.decode_content = True
+            with open(filename, 'wb', buffering=block_size) as f:
+                shutil.copyfileobj(r.raw, f, length=block_size)
+            got_bytes = os.path.getsize(filename)
+        else:
+            #Match the write buffer to the chunk size
+            pending = 0
+            with open(filename, 'wb', buffering=block_size) as f:
+                for chunk in r.iter_content(chunk_size=block_size):
+                    got_bytes += len(chunk)
+                    # If you have chunk encoded response uncomment if
+                    # and set chunk_size parameter to None.
+                    #if chunk:
+                    f.write(chunk)
+                    #Accumulate bytes and update the bar at most once per MiB
+                    #to keep the chunk loop free of per-iteration bar overhead
+                    pending += len(chunk)
+                    if pending >= DEFAULT_CHUNK_SIZE:
+                        progress_bar.update(pending)
+                        pending = 0
+            if pending:
+                progress_bar.update(pending)
             progress_bar.close()
         if total_size_in_bytes != 0 and got_bytes != total_size_in_bytes:
             print("ERROR, something went wrong")
@@ -178,6 +260,10 @@ def download_asset(filename, dest=None, project=None, task=None, overwrite=False
     """
     Call WebODM API endpoint to download an asset file
 
+    The response is streamed to disk in 1MiB chunks, so peak memory use
+    stays constant regardless of asset size (orthophotos and point clouds
+    can run to multiple GB)
+
     Parameters
     ----------
     filename: str
@@ -202,7 +288,58 @@ def download_asset(filename, dest=None, project=None, task=None, overwrite=False
         res = download(f'/projects/{project}/tasks/{task}/assets/{filename}', filename=dest, overwrite=overwrite, progress=progress)
     return res
 
-def export_asset(asset, params, project=None, task=None, overwrite=False, progress=True):
+def _parallel_transfer(func, items, progress=True, max_workers=8, **kwargs):
+    """
+    Run a per-file transfer function over a list of files with a thread pool
+
+    Network transfers release the GIL so threads scale throughput until the
+    link is saturated, connections are reused from the shared session pool.
+    Shows a single progress bar over the file count instead of per-file bars.
+    """
+    if progress and _tqdm is None:
+        progress = False
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(func, i, progress=False, **kwargs) for i in items]
+        if progress:
+            bar = _tqdm(total=len(futures), unit='file', leave=False)
+            for f in futures:
+                f.add_done_callback(lambda _: bar.update(1))
+        results = [f.result() for f in futures]
+        if progress:
+            bar.close()
+    return results
+
+def download_assets(filenames, project=None, task=None, overwrite=False, progress=True, max_workers=8):
+    """
+    Call WebODM API endpoint to download multiple asset files in parallel
+
+    Parameters
+    ----------
+    filenames: list
+        asset filenames to download
+    project: int
+        project ID
+    task: str
+        task ID
+    progress: bool
+        Show progress bar (one bar over all files)
+    max_workers: int
+        maximum parallel downloads
+
+    Returns
+    -------
+    list
+        local filenames saved
+    """
+    #Use the default selections unless arg passed
+    project, task = get_selection(project, task)
+
+    return _parallel_transfer(download_asset, filenames, progress=progress,
+                              max_workers=max_workers,
+                              project=project, task=task, overwrite=overwrite)
+
+def export_asset(asset, params, project=None, task=None, overwrite=False, progress=True, timeout_seconds=300):
     """
     Call WebODM API endpoints to export a converted asset file
     The existing asset file can be downloaded with the /download/fn endpoint
@@ -223,6 +360,9 @@ def export_asset(asset, params, project=None, task=None, overwrite=False, progre
         task ID
     progress: bool
         Show progress bar
+    timeout_seconds: int
+        Seconds to wait for the conversion to complete before
+        raising an exception
 
 
     data {
@@ -262,23 +402,27 @@ def export_asset(asset, params, project=None, task=None, overwrite=False, progre
 
     #First post to /export, then get from the task
     res = call_api(f'/projects/{project}/tasks/{task}/{asset}/export', data=params)
-    data = res.json()
+    data = _parse_json(res)
     if 'celery_task_id' in data:
         # wait for the result to be available before continuing
         worker_id = data['celery_task_id']
         print("Processing request...", end='')
-        timeout_seconds = 60
         result = {"ready": False}
-        for i in range(0,timeout_seconds):
-            time.sleep(1)
+        #Poll with exponential backoff, an early first check catches fast
+        #conversions while the capped delay limits API calls for slow ones
+        deadline = time.monotonic() + timeout_seconds
+        delay = 0.2
+        while time.monotonic() < deadline:
+            time.sleep(delay)
             #Check the status
             r = call_api(f'/workers/check/{worker_id}')
-            result = r.json()
+            result = _parse_json(r)
             if result["ready"]:
                 break
+            delay = min(delay * 1.5, 5.0)
             print('.', end='')
             sys.stdout.flush()
-    
+
         if not result["ready"]:
             raise(Exception("Timed out awaiting result!"))
         else:
@@ -288,7 +432,7 @@ def export_asset(asset, params, project=None, task=None, overwrite=False, progre
 
     return res
 
-def upload(url, filepath, dest=None, block_size=8192, progress=True, throw=False, prefix=auth.settings["token_prefix"], **kwargs):
+def upload(url, filepath, dest=None, block_size=DEFAULT_CHUNK_SIZE, progress=True, throw=False, prefix=_TOKEN_PREFIX, **kwargs):
     """
     Call an API endpoint to upload a file
 
@@ -303,7 +447,7 @@ def upload(url, filepath, dest=None, block_size=8192, progress=True, throw=False
     progress: bool
         Show progress bar
     block_size: int
-        size of chunks to upload
+        size of chunks to upload, default 1MiB
     throw: bool
         throw exception on http errors, default: False
 
@@ -312,16 +456,13 @@ def upload(url, filepath, dest=None, block_size=8192, progress=True, throw=False
     object
         http response object
     """
-    if url[0:4] != "http":
+    if not url.startswith(("http://", "https://")):
         #Prepend the configured api url
         url = auth.settings["api_audience"] + url
 
     #Progress bar
-    if progress:
-        if is_notebook():
-            from tqdm.notebook import tqdm
-        else:
-            from tqdm import tqdm
+    if progress and _tqdm is None:
+        progress = False
 
     #Pass any additional post data in kwargs
     fields = kwargs
@@ -335,21 +476,25 @@ def upload(url, filepath, dest=None, block_size=8192, progress=True, throw=False
         filename = path.name
 
     def do_upload(bar=None):
-        with open(filepath, "rb") as f:
+        #Buffered reads at block_size so the encoder streams from memory
+        #instead of funnelling many small file reads through urllib3
+        with open(filepath, "rb", buffering=block_size) as f:
             fields["file"] = (filename, f)
             e = MultipartEncoder(fields=fields)
             data = e
             if bar:
-                m = MultipartEncoderMonitor(e, lambda monitor: bar.update(monitor.bytes_read - bar.n))
+                #Update the bar at buffer granularity, not per internal read
+                def update_bar(monitor):
+                    if monitor.bytes_read - bar.n >= block_size or monitor.bytes_read >= total_size:
+                        bar.update(monitor.bytes_read - bar.n)
+                m = MultipartEncoderMonitor(e, update_bar)
                 data = m
             headers = {'Content-Type': data.content_type}
-            if not auth.cookies:
-                access_token = auth.get_token()
-                headers['Authorization'] = prefix + ' ' + access_token
-            return requests.post(url, data=data, headers=headers, cookies=auth.cookies)
+            _refresh_auth_header(prefix)
+            return _session.post(url, data=data, headers=headers, cookies=auth.cookies)
 
     if progress:
-        with tqdm(desc=filename, total=total_size, unit="B", unit_scale=True, unit_divisor=block_size, leave=False) as bar:
+        with _tqdm(desc=filename, total=total_size, unit="B", unit_scale=True, unit_divisor=block_size, leave=False) as bar:
             return do_upload(bar)
     else:
         return do_upload()
@@ -393,6 +538,35 @@ def upload_asset(filename, dest=None, project=None, task=None, progress=True):
         destfile = fn
     return upload(f'/projects/{project}/tasks/{task}/assets/{destpath}', filename, destfile, progress=progress)
 
+def upload_assets(filenames, project=None, task=None, progress=True, max_workers=8):
+    """
+    Call WebODM API endpoint to upload multiple asset files in parallel
+
+    Parameters
+    ----------
+    filenames: list
+        asset filenames to upload (can include subdir)
+    project: int
+        project ID
+    task: str
+        task ID
+    progress: bool
+        Show progress bar (one bar over all files)
+    max_workers: int
+        maximum parallel uploads
+
+    Returns
+    -------
+    list
+        http response objects
+    """
+    #Use the default selections unless arg passed
+    project, task = get_selection(project, task)
+
+    return _parallel_transfer(upload_asset, filenames, progress=progress,
+                              max_workers=max_workers,
+                              project=project, task=task)
+
 def upload_image(filename, project, task, progress=True):
     """
     Call WebODM API endpoint to upload a source image file
@@ -418,8 +592,37 @@ def upload_image(filename, project, task, progress=True):
 
     return upload(f'/projects/{project}/tasks/{task}/upload/', filename, progress=progress)
 
+def upload_images(filenames, project=None, task=None, progress=True, max_workers=8):
+    """
+    Call WebODM API endpoint to upload multiple source image files in parallel
 
-def call_api_js(url, callback="alert", data=None, prefix=auth.settings["token_prefix"]):
+    Parameters
+    ----------
+    filenames: list
+        image filenames to upload
+    project: int
+        project ID
+    task: str
+        task ID
+    progress: bool
+        Show progress bar (one bar over all files)
+    max_workers: int
+        maximum parallel uploads
+
+    Returns
+    -------
+    list
+        http response objects
+    """
+    #Use the default selections unless arg passed
+    project, task = get_selection(project, task)
+
+    return _parallel_transfer(upload_image, filenames, progress=progress,
+                              max_workers=max_workers,
+                              project=project, task=task)
+
+
+def call_api_js(url, callback="alert", data=None, prefix=_TOKEN_PREFIX):
     """
     Call an API endpoint from the browser via Javascript, appends a script to the page to 
     do the request.
@@ -437,10 +640,8 @@ def call_api_js(url, callback="alert", data=None, prefix=auth.settings["token_pr
     from IPython.display import display, HTML
     access_token = auth.get_token()
     #Generate a code to prevent this call happening again if page reloaded without clearing
-    import string
     import secrets
-    alphabet = string.ascii_letters + string.digits
-    code = "req_" + ''.join(secrets.choice(alphabet) for i in range(8))
+    code = "req_" + secrets.token_urlsafe(6)
     method = "POST"
     if data is None:
         method = "GET"
@@ -496,7 +697,7 @@ def userinfo():
         json dict containing user info
     """
     r = call_api(auth.settings["api_authurl"] + '/userinfo') #, prefix='Bearer')
-    data = r.json()
+    data = _parse_json(r)
     return data
 
 def showuserinfo():
@@ -509,22 +710,63 @@ def showuserinfo():
     from IPython.display import display, HTML
     display(HTML("<img src='" + user["picture"] + "' width='120' height='120'>"))
 
-def load_projects_and_tasks(cache=project_dir):
+#Cached project/task data with fetch timestamp
+#(widget setup can request this several times in quick succession)
+_projects_cache = {"data": None, "ts": 0.0}
+
+def invalidate_projects_cache(cache=project_dir):
+    """
+    Clear the cached project/task data, in memory and on disk, forcing
+    the next load_projects_and_tasks() call to fetch fresh data from the API
+    """
+    _projects_cache["data"] = None
+    _projects_cache["ts"] = 0.0
+    #Remove the disk cache too, otherwise the next load would just re-read it
+    try:
+        os.remove(os.path.join(cache, 'projects.json'))
+    except (OSError) as e:
+        pass
+
+def load_projects_and_tasks(cache=project_dir, ttl=60):
     #Get user projects and task info from  public API
+    #Re-use data fetched within the last `ttl` seconds
+    if _projects_cache["data"] is not None and time.monotonic() - _projects_cache["ts"] < ttl:
+        return _projects_cache["data"]
+    #Otherwise use the file cached on disk if less than 10 minutes old
+    fn = os.path.join(cache, 'projects.json')
+    try:
+        if os.path.exists(fn) and time.time() - os.path.getmtime(fn) < 600:
+            with open(fn, 'r') as infile:
+                jsondata = json.load(infile)
+            _projects_cache["data"] = jsondata
+            _projects_cache["ts"] = time.monotonic()
+            return jsondata
+    except (Exception) as e:
+        pass
     user = os.getenv('JUPYTERHUB_USER', '')
     url = auth.settings["api_audience"] + "/plugins/asdc/usertasks?email=" + user
     try:
-        response = requests.get(url, timeout=10, cookies=auth.cookies)
-        jsondata = response.json()
+        response = _session.get(url, timeout=10, cookies=auth.cookies)
+        jsondata = _parse_json(response)
+        _projects_cache["data"] = jsondata
+        _projects_cache["ts"] = time.monotonic()
         #Save to ./projects
         os.makedirs(cache, exist_ok=True)
-        with open(os.path.join(cache, 'projects.json'), 'w') as outfile:
+        with open(fn, 'w') as outfile:
             json.dump(jsondata, outfile)
         return jsondata
     except (Exception) as e:
         print("Failed to load user projects from api", e)
         return None
 
+#Memoized slugify results
+#(slugify is a pure-python unicode normalise + regex pipeline and
+# dominates create_links() for users with many projects/tasks)
+_slug_cache = {}
+
+def _slug(name):
+    return _slug_cache.setdefault(name, slugify(name))
+
 def create_links(src='/mnt/project', dest=project_dir):
     """
     Create symlinks with nicer names for mounted projects and tasks
@@ -539,28 +781,33 @@ def create_links(src='/mnt/project', dest=project_dir):
     prjfolders = [ f.path for f in os.scandir(src) if f.is_dir() ]
 
     audience = auth.settings["api_audience"]
-    if auth.access_token:
-        #Can use authenticated API for each mounted project
-        jsondata = None
+    #Use the public API first - a single (cached) round trip covering all
+    #projects, rather than one authenticated call per mounted project
+    jsondata = load_projects_and_tasks(dest)
+    if jsondata:
+        jsondata = dict(jsondata) #Don't mutate the cached copy below
     else:
-        #Use the public API, requires valid username, returns all projects
-        jsondata = load_projects_and_tasks(dest)
-        if not jsondata:
+        if not auth.access_token:
             return
+        jsondata = {}
+
+    #Any mounted projects missing from the bulk data need the
+    #authenticated per-project endpoint, fetch those in parallel
+    missing = [Path(pf).name for pf in prjfolders if Path(pf).name not in jsondata]
+    if missing and auth.access_token:
+        def gettasks(PID):
+            response = call_api(f"{audience}/plugins/asdc/projects/{PID}/gettasks")
+            return PID, _parse_json(response)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            jsondata.update(pool.map(gettasks, missing))
 
     #2) Iterate projects....
     for pf in prjfolders:
         ppath = Path(pf)
         PID = ppath.name
 
-        #Use provided project/task data or call the API
-        if jsondata:
-            data = jsondata[PID]
-        else:
-            #Use authenticated endpoint
-            response = call_api(f"{audience}/plugins/asdc/projects/{PID}/gettasks")
-            data = response.json()
-        if not "name" in data:
+        data = jsondata.get(PID)
+        if data is None or not "name" in data:
             print("Unexpected response: ", data)
             return
 
@@ -568,10 +815,10 @@ def create_links(src='/mnt/project', dest=project_dir):
 
         #2b)  - Create dir $HOME/project/ with verbose name (use python-slugify)
         #Append ID to handle projects with duplicate name
-        projdir = str(PID) + '_' + slugify(projname)
+        projdir = f"{PID}_{_slug(projname)}"
         #projdir = str(PID).zfill(5) + '_' + slugify(projname)
         try:
-            os.makedirs(dest + '/' + projdir, exist_ok=True)
+            os.makedirs(f"{dest}/{projdir}", exist_ok=True)
         except (FileExistsError) as e:
             pass
 
@@ -585,15 +832,18 @@ def create_links(src='/mnt/project', dest=project_dir):
             if t["name"] is None:
                 t["name"] = str(t["id"])
             tpath = ppath / "task" / str(t['id'])
-            lnpath = dest + '/' + projdir + '/' + str(idx) + '_' + slugify(t["name"]) # + '_(' + str(t['id'])[0:8] + ')'
+            lnpath = f"{dest}/{projdir}/{idx}_{_slug(t['name'])}" # + '_(' + str(t['id'])[0:8] + ')'
             #lnpath = dest + '/' + projdir + '/' + str(idx).zfill(fill) + '_' + slugify(t["name"]) # + '_(' + str(t['id'])[0:8] + ')'
-            #Remove any existing file/link
+            #3b create symlink for task under a temp name, then move into
+            #place atomically - replaces any existing file/link without a
+            #separate remove+recreate round trip
+            tmppath = lnpath + '.tmp'
             try:
-                os.remove(lnpath)
-            except (FileNotFoundError) as e:
-                pass
-            #3b create symlink for task using same function as above
-            os.symlink(tpath, lnpath)
+                os.symlink(tpath, tmppath)
+            except (FileExistsError) as e:
+                os.remove(tmppath)
+                os.symlink(tpath, tmppath)
+            os.replace(tmppath, lnpath)
             idx += 1
 
 def get_tasks():
@@ -631,13 +881,17 @@ def project_tasks(filtered=True, home=project_dir):
     if not project_dict:
         return None
 
+    #Hash the selection lists once so membership tests below are O(1)
+    plist_set = set(plist)
+    tlist_set = set(tlist)
     for p in project_dict:
-        sel_p = int(p) in plist
+        proj = project_dict[p]
+        sel_p = int(p) in plist_set
         if not filtered or sel_p:
-            output += [project_dict[p]]
+            output += [proj]
             otasks = []
-            for t in project_dict[p]["tasks"]:
-                sel_t = t["id"] in tlist
+            for t in proj["tasks"]:
+                sel_t = t["id"] in tlist_set
                 if not filtered or sel_t:
                     otasks += [t]
                     if not filtered:
@@ -724,7 +978,7 @@ def project_select(filtered=False):
     """
     Display project selection widget only
     """
-    if not is_notebook():
+    if not _IS_NOTEBOOK:
         return
     import ipywidgets as widgets
     from IPython.display import display
@@ -756,7 +1010,7 @@ def task_select(filtered=False):
     """
     Display project and task selection widgets
     """
-    if not is_notebook():
+    if not _IS_NOTEBOOK:
         return
     import ipywidgets as widgets
     from IPython.display import display
@@ -874,11 +1128,10 @@ def new_task(name, project=None, options=None):
             "dsm": True
         }
     # convert into list with "name" / "value" dictionaries, suitable for ODM
-    options_list = [{"name": k, "value": v} for k, v in options.items()]
     data = {
         "partial": True,
         "name": name,
-        "options": options_list
+        "options": [{"name": k, "value": v} for k, v in options.items()]
     }
 
     url = f"/projects/{project}/tasks/"
@@ -886,8 +1139,9 @@ def new_task(name, project=None, options=None):
     if not res.ok:
         print("Error response:", res, url)
         return None
-    task = res.json()
-    return res.json()["id"]
+    #Parse the response body once
+    task = _parse_json(res)
+    return task["id"]
 
 def import_task(name, path=None, dest=None, project=None):
     """
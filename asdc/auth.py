@@ -50,22 +50,59 @@ print(r.json())
 """
 
 import requests
+from requests.adapters import HTTPAdapter, Retry
+import asyncio
+import concurrent.futures
+import functools
 import json
+#Faster token payload parsing if available, stdlib json otherwise
+try:
+    import orjson as _json
+except (ImportError) as e:
+    import json as _json
+import secrets
 import os
 import logging
 import datetime
 import time
 import sys
+import urllib.parse
 from pathlib import Path
 import jwt
 from asdc.utils import *
 
+@functools.lru_cache(maxsize=None)
+def _load_tornado():
+    """
+    Import tornado on first use, returns None if not installed
+
+    Only needed for the token listener server, deferring the import keeps
+    'import asdc' cold start fast for scripts that never start the listener
+    (tornado.httpserver and friends cost hundreds of ms to import)
+    """
+    try:
+        import tornado.ioloop
+        import tornado.web
+        import tornado.httpserver
+        import tornado.netutil
+        return tornado
+    except (ImportError) as e:
+        return None
+
+#Shared session with pooled keep-alive connections, avoids a new
+#TCP+TLS handshake for every token request / device-flow poll
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])))
+
 baseurl = ''      #Base jupyterhub url
 access_token = '' #Store the received token here
 token_data = ''   #All the received token data
 port = None       #Server port, default is to automatically assign
 nonce = ''        #For verifying token
 _server = None     #Server to receive token
+_token_event = None #Set when the token arrives, created with the server
+_base_query = None  #Cached static portion of the authorize query string
 cookies = None
 
 #Settings, to be provided before use
@@ -81,7 +118,10 @@ settings = {
     "provided" : False
 }
 
-def setup(config=None):
+#Only parse the .env files from disk once per process
+_dotenv_loaded = False
+
+def setup(config=None, force=False):
     """Pass a dict with the authentication settings
 
     eg:
@@ -98,17 +138,23 @@ def setup(config=None):
     ----------
     config: dict
         The configuration dict
+    force: bool
+        Re-read the .env files even if already loaded this session
     """
-    global settings
+    global settings, _dotenv_loaded, _base_query
+    #Settings may change, rebuild the cached authorize query string
+    _base_query = None
     if config is None:
         #Try and load from env variables
-        # load .env first if exists
-        from dotenv import load_dotenv
-        envhome = str(Path.home() / '.env')
-        if os.path.exists(envhome):
-            load_dotenv(envhome)
-        if os.path.exists('.env'):
-            load_dotenv()
+        # load .env first if exists (re-parsed only on first call or force)
+        if not _dotenv_loaded or force:
+            from dotenv import load_dotenv
+            envhome = str(Path.home() / '.env')
+            if os.path.exists(envhome):
+                load_dotenv(envhome)
+            if os.path.exists('.env'):
+                load_dotenv()
+            _dotenv_loaded = True
         try:
             settings["default_baseurl"] = os.getenv('JUPYTERHUB_URL', 'http://localhost:8888')
             if not "localhost" in settings["default_baseurl"]:
@@ -146,7 +192,10 @@ async def check_server(url):
     """
     logging.info("Testing url: ", url)
 
-    r = requests.get(U)
+    #Run the blocking request in a worker thread so the
+    #event loop (and any server handlers on it) keep running
+    loop = asyncio.get_event_loop()
+    r = await loop.run_in_executor(None, functools.partial(_session.get, url, timeout=5))
 
     if r.status_code >= 400:
         logging.info("Server responded error: {} {}".format(r.status_code, r.reason))
@@ -154,6 +203,113 @@ async def check_server(url):
     else:
         logging.info("Server responded OK: {} {}\n{}".format(r.status_code, r.reason, r.text))
 
+def _minify_js(source):
+    #Shrink an inline script before shipping it to the browser
+    #(drops comment-only lines and indentation, keeps newlines so
+    # the remaining statements are unaffected)
+    lines = [l.strip() for l in source.splitlines()]
+    return '\n'.join(l for l in lines if l and not l.startswith('//'))
+
+#The page templates never change, build (and minify) them once at import
+from string import Template
+_LISTENER_TEMPLATE = Template(_minify_js("""
+    <script>
+    //Have the token, send back to server with HTTP POST
+    //(keepalive lets the request complete even if the page unloads)
+    function postToken_$PORT(data, reuse) {
+        var body = {token: data, verify: !reuse, pad: ''};
+        //Pad the payload to the next power-of-two size bucket so its
+        //length doesn't leak token sizes
+        var len = JSON.stringify(body).length;
+        var bucket = 1;
+        while (bucket < len) bucket *= 2;
+        body.pad = 'x'.repeat(bucket - len);
+        fetch('$BASEURL/proxy/$PORT/token', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(body),
+            keepalive: true
+        }).then(function() {console.log('postToken successful');});
+    }
+
+    //Get message from iframe or popup
+    function message_received(event) {
+        //console.log("ORIGIN:" + event.origin);
+        //console.log("MESSAGE:" + JSON.stringify(event.data));
+        if ("access_token" in event.data) {
+            //Save token on client side
+            window.token = event.data;
+
+            postToken_$PORT(event.data);
+
+            //Stop listening after sending token
+            window.removeEventListener('message', self);
+            //window.listenerExists = false;
+
+            //Close iframe if any
+            document.querySelectorAll('.asdc-oauth-frame').forEach(e => e.remove());
+        } else {
+            //Show iframe if any
+            document.querySelectorAll('.asdc-oauth-frame').forEach(e => e.style.height = '300px');
+        }
+    }
+    window.addEventListener("message", message_received);
+    </script>
+    """))
+
+_SEND_TEMPLATE = Template(_minify_js("""<script>
+    //This code only has 10 seconds to run after the output produced
+    //(Prevents re-running from saved notebook output)
+    var now = new Date().getTime();
+    var ts = new Date(document.getElementById('$ID').dataset.timestamp * 1000);
+    if (now - ts < 10000) {
+        var mode = "$MODE";
+        if (window.token) {
+            var now = new Date().valueOf();
+            var tokens = window.token['access_token'].split(".");
+            var access = JSON.parse(atob(tokens[1]));
+            console.log("ID Token expired?: " + (window.token['id_token']['exp']*1000 <= now));
+            console.log("Access Token expired?: " + (access['exp']*1000 <= now));
+            if (window.token['id_token']['exp']*1000 > now && access['exp']*1000 > now) {
+                //Use saved token on client side
+                postToken_$PORT(window.token, true); //Pass re-use flag to skip verification
+            } else {
+                //Clear expired tokens
+                window.token = null;
+            }
+        }
+
+        function show_frame() {
+            var frames = document.querySelectorAll('.asdc-oauth-frame');
+            if (frames.length) {
+                frames.forEach(e => e.style.height = '300px');
+                //Try popup
+                window.open("$URL");
+            }
+        }
+
+        if (!window.token) {
+            var alt = '(Automatic authentication via $MODE processing, <a href="$URL" target="_blank" rel="opener">click here</a> to login manually)';
+            if (mode == 'popup') {
+                window.open("$URL");
+                html = alt;
+            } else if (mode == 'iframe') {
+                html = '<iframe class="asdc-oauth-frame" src="$URL" style="width: 400px; height: 0px; border: 0;"></iframe><br>' + alt;
+                setTimeout(show_frame, 5000); //Show the frame if still there after 5 seconds
+            } else if (mode == 'iframe_debug') {
+                html = '<iframe src="$URL" width="400px" height="300px" style="border:1px solid #ccc;"></iframe><br>' + alt;
+            } else if (mode == 'link') {
+                html = '<h3><a href="$URL" target="_blank" rel="opener">Click here to login</a></h3>';
+            }
+            document.getElementById('$ID').innerHTML = html;
+        }
+    } else {
+      console.log("Fragment expired, skipping run: " + new Date(now).toUTCString() + " : " + new Date(ts).toUTCString());
+    }
+    </script>
+    <div id="$ID" data-timestamp="$NOW"></div>
+    """))
+
 async def _serve():
     """
     Listen for the token passed by browser on client side
@@ -161,19 +317,39 @@ async def _serve():
     
     See: https://notebook.community/knowledgeanyhow/notebooks/hacks/Webserver%20in%20a%20Notebook
     """
-    global settings, port, token_data, _server
-    import tornado.ioloop
-    import tornado.web
-    import tornado.httpserver
+    global settings, port, token_data, _server, _token_event
 
-    #Stop any existing server
+    tornado = _load_tornado()
+    if tornado is None:
+        raise(Exception("tornado is required for the token listener server"))
+
+    #Use the faster libuv-backed event loop if available
+    #(tornado 6 runs on whichever asyncio loop policy is active)
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+            uvloop.install()
+        except (ImportError) as e:
+            pass
+
+    #Singleton: if a listener is already running just reuse it and its port,
+    #tearing it down and rebinding for every connect() call is wasted work
+    #(call stop_server() first to force a fresh instance)
     if _server:
-        await stop_server()
+        #Clear any stale token signal from a previous auth round
+        if _token_event:
+            _token_event.clear()
+        return
+
+    #Event signalled by set_token when the token arrives
+    _token_event = asyncio.Event()
 
     def set_token(data, verify=True):
         global nonce, token_data
         logging.debug("Verfifying, nonce: ", nonce, ", verify enabled: ",verify)
-        if verify and data['id_token']['nonce'] != nonce:
+        #Constant-time comparison, a plain != short-circuits on the first
+        #differing byte and leaks timing information about the nonce
+        if verify and not secrets.compare_digest(data['id_token']['nonce'], nonce):
             logging.error("INVALID TOKEN! Nonce does not match")
             token_data = None
         else:
@@ -182,6 +358,10 @@ async def _serve():
             else:
                 logging.debug("==> TOKEN Reused, already validated")
             token_data = data
+            #Wake any connect() call awaiting the token
+            #(handlers run on the event loop thread, safe to set directly)
+            if _token_event:
+                _token_event.set()
 
     class MainHandler(tornado.web.RequestHandler):
         def get(self):
@@ -192,21 +372,14 @@ async def _serve():
 
     class TokenHandler(tornado.web.RequestHandler):
         def post(self):
-            import json
-            data = self.request.body
-            t = json.loads(data)
             logging.debug("==> TOKEN RECEIVED via POST")
-            set_token(t)
-            self.finish("Token processed")
-
-        def get(self):
-            import json
-            import base64
-            logging.debug("==> TOKEN RECEIVED via GET")
-            data = self.get_argument("data", default=None, strip=False)
-            verify = self.get_argument("verify", default="True", strip=False)
-            t = json.loads(base64.b64decode(data).decode('utf-8'))
-            set_token(t, verify == "True") #Can't verify when reusing token as nonce may have been cleared
+            body = _json.loads(self.request.body)
+            #Listener script wraps the token with a verify flag (and size
+            #padding, which is simply ignored), but accept a bare token
+            #blob too for direct callers
+            t = body.get("token", body)
+            verify = body.get("verify", True)
+            set_token(t, verify) #Can't verify when reusing token as nonce may have been cleared
             self.finish("Token processed")
 
     application = tornado.web.Application([
@@ -214,16 +387,14 @@ async def _serve():
         (r"/token", TokenHandler)
     ])
 
-    #Selects a random port by default,
+    #Selects a random port by default (bind port 0),
     #allowing multiple notebooks to use this without conflicts
+    sockets = tornado.netutil.bind_sockets(port or 0, '0.0.0.0')
     _server = tornado.httpserver.HTTPServer(application)
-    _server.listen(port, '0.0.0.0')
-    
-    #Get the actual port assigned
-    if port is None:
-        #(First entry in _sockets)
-        socket = _server._sockets[next(iter(_server._sockets))]
-        port = socket.getsockname()[1]
+    _server.add_sockets(sockets)
+
+    #Get the actual port assigned, via the public socket API
+    port = sockets[0].getsockname()[1]
 
     logging.debug("Running on port: ", port) 
 
@@ -238,58 +409,7 @@ def _listener():
         logging.info("Base url: ", baseurl)
 
     from IPython.display import display, HTML
-    from string import Template
-    temp_obj = Template("""
-    <script>
-    //Have the token, send back to server with HTTP POST
-    function postToken_$PORT(data) {
-        var xhr = new XMLHttpRequest();
-        xhr.open("POST", '$BASEURL/proxy/$PORT/token', true);
-        //Send the proper header information along with the request
-        xhr.setRequestHeader("Content-Type", "application/json");
-        xhr.onload = function() {console.log('postToken successful');}
-        xhr.send(JSON.stringify(data));
-    }
-
-    //Have the token, send back to server with HTTP GET
-    function postTokenGET_$PORT(data, reuse) {
-        var xhr = new XMLHttpRequest();
-        var encoded = window.btoa(JSON.stringify(data));
-        var uri = '$BASEURL/proxy/$PORT/token?data=' + encoded;
-        if (reuse)
-            uri += '&verify=False';
-        xhr.open("GET", uri);
-        xhr.onload = function() {console.log('postTokenGET successful');}
-        xhr.send();
-    }
-
-    //Get message from iframe or popup
-    function message_received(event) {
-        //console.log("ORIGIN:" + event.origin);
-        //console.log("MESSAGE:" + JSON.stringify(event.data));
-        if ("access_token" in event.data) {
-            //Save token on client side
-            window.token = event.data;
-
-            //POST gets 405 method not allowed on jupyterhub
-            //postToken_$PORT(event.data);
-            postTokenGET_$PORT(event.data);
-
-            //Stop listening after sending token
-            window.removeEventListener('message', self);
-            //window.listenerExists = false;
-
-            //Close iframe if any
-            document.querySelectorAll('.asdc-oauth-frame').forEach(e => e.remove());
-        } else {
-            //Show iframe if any
-            document.querySelectorAll('.asdc-oauth-frame').forEach(e => e.style.height = '300px');
-        }
-    }
-    window.addEventListener("message", message_received);
-    </script>
-    """)
-    script = temp_obj.substitute(BASEURL=baseurl, PORT=str(port))
+    script = _LISTENER_TEMPLATE.substitute(BASEURL=baseurl, PORT=str(port))
     display(HTML(script))
 
 def _send(mode='iframe'):
@@ -302,83 +422,33 @@ def _send(mode='iframe'):
         'iframe' opens page in inline iframe (this seems less reliable)
         'link' displays link to the auth page without opening it automatically
     """
-    import urllib
     #This uses jupyter-server-proxy entry-point magic to provide a consistent callback url
     redirect = baseurl + '/asdc/callback'
-    import secrets
-    global nonce, port
-    nonce = secrets.token_urlsafe(nbytes=8)
-    f = {'response_type' : 'token id_token',
-         'redirect_uri' : redirect,
-         'client_id' : settings["api_client_id"],
-         'audience' : settings["api_audience"],
-         'scope' : settings["api_scope"],
+    global nonce, port, _base_query
+    nonce = secrets.token_urlsafe(nbytes=32)
+    #The static params only change when setup() is called, so the encoded
+    #prefix is cached and only the per-request params encoded each time
+    if _base_query is None:
+        _base_query = urllib.parse.urlencode(
+            {'response_type' : 'token id_token',
+             'client_id' : settings["api_client_id"],
+             'audience' : settings["api_audience"],
+             'scope' : settings["api_scope"],
+             #'prompt' : 'none'}
+            })
+    f = {'redirect_uri' : redirect,
          'nonce' : nonce,
          'state' : 'auth0,' + nonce,
          #'state' : 'auth0,iframe,' + nonce,
          #'state' : 'auth0,popup,' + nonce,
-         #'prompt' : 'none'}
         }
     logging.debug("Auth query params: ", f)
     #print("Auth query params: ", f)
-    query = urllib.parse.urlencode(f)
+    query = _base_query + '&' + urllib.parse.urlencode(f)
     authurl = settings["api_authurl"] + '/authorize?' + query
 
     from IPython.display import HTML
-    from string import Template
-    temp_obj = Template("""<script>
-    //This code only has 10 seconds to run after the output produced
-    //(Prevents re-running from saved notebook output)
-    var now = new Date().getTime();
-    var ts = new Date(document.getElementById('$ID').dataset.timestamp * 1000);
-    if (now - ts < 10000) {
-        var mode = "$MODE";
-        if (window.token) {
-            var now = new Date().valueOf();
-            var tokens = window.token['access_token'].split(".");
-            var access = JSON.parse(atob(tokens[1]));
-            console.log("ID Token expired?: " + (window.token['id_token']['exp']*1000 <= now));
-            console.log("Access Token expired?: " + (access['exp']*1000 <= now));
-            if (window.token['id_token']['exp']*1000 > now && access['exp']*1000 > now) {
-                //Use saved token on client side
-                postTokenGET_$PORT(window.token, true); //Pass re-use flag to skip verification
-            } else {
-                //Clear expired tokens
-                window.token = null;
-            }
-        }
-
-        function show_frame() {
-            var frames = document.querySelectorAll('.asdc-oauth-frame');
-            if (frames.length) {
-                frames.forEach(e => e.style.height = '300px');
-                //Try popup
-                window.open("$URL");
-            }
-        }
-
-        if (!window.token) {
-            var alt = '(Automatic authentication via $MODE processing, <a href="$URL" target="_blank" rel="opener">click here</a> to login manually)';
-            if (mode == 'popup') {
-                window.open("$URL");
-                html = alt;
-            } else if (mode == 'iframe') {
-                html = '<iframe class="asdc-oauth-frame" src="$URL" style="width: 400px; height: 0px; border: 0;"></iframe><br>' + alt;
-                setTimeout(show_frame, 5000); //Show the frame if still there after 5 seconds
-            } else if (mode == 'iframe_debug') {
-                html = '<iframe src="$URL" width="400px" height="300px" style="border:1px solid #ccc;"></iframe><br>' + alt;
-            } else if (mode == 'link') {
-                html = '<h3><a href="$URL" target="_blank" rel="opener">Click here to login</a></h3>';
-            }
-            document.getElementById('$ID').innerHTML = html;
-        }
-    } else {
-      console.log("Fragment expired, skipping run: " + new Date(now).toUTCString() + " : " + new Date(ts).toUTCString());
-    }
-    </script>
-    <div id="$ID" data-timestamp="$NOW"></div>
-    """)
-    script = temp_obj.substitute(URL=authurl, ID="auth_" + nonce, MODE=mode, PORT=port, NOW=str(int(time.time())))
+    script = _SEND_TEMPLATE.substitute(URL=authurl, ID="auth_" + nonce, MODE=mode, PORT=port, NOW=str(int(time.time())))
     display(HTML(script))
 
 def get_token():
@@ -409,7 +479,7 @@ def get_token():
             return None
 
         server = f"http://localhost:{port}/tokens"
-        r = requests.get(server, headers={'Content-type': 'application/json'})
+        r = _session.get(server, headers={'Content-type': 'application/json'})
 
         if r.status_code >= 400:
             logging.info("Server responded error: {} {}".format(r.status_code, r.reason))
@@ -476,21 +546,26 @@ def authenticate(config=None): #, scope=""):
             def window_open_button(url):
                 with out:
                     timeout_seconds=10
-                    import asyncio
-                    print('Waiting for authorisation', end='')
+                    ticks = timeout_seconds*4 #4 ticks per second
+                    #Single progress widget updated in place, avoids spamming
+                    #the output area with a stream of '.' characters
+                    bar = widgets.IntProgress(value=0, min=0, max=ticks,
+                                              description='Waiting...')
+                    display(bar)
                     data = read_inputs()
                     port = data["port"]
-                    for i in range(0,timeout_seconds*4): #4 ticks per second
+                    for i in range(0,ticks):
                         #Have the port yet?
                         if port:
+                            bar.value = ticks
+                            bar.bar_style = 'success'
                             authenticate()
-                            print(' done, you are logged in.')
+                            print('Done, you are logged in.')
                             break
                         #Blocking sleep
                         time.sleep(0.25)
                         #Visual feedback
-                        print('.', end='')
-                        sys.stdout.flush()
+                        bar.value = i + 1
                         #Attempt to load port again
                         data = read_inputs()
                         port = data["port"]
@@ -584,21 +659,14 @@ async def connect(config=None, mode='iframe', timeout_seconds=30, scope=""):
         _listener()
         _send(mode)
 
-        import asyncio
-        import time
-        import sys
-        print('Waiting for authorisation', end='')
-        for i in range(0,timeout_seconds*4): #4 ticks per second
-            #Have the token yet?
-            if token_data: break
-            #Async sleep to allow server to process requests
-            await asyncio.sleep(0.25)
-            #Blocking sleep to actually pause processing
-            time.sleep(0.25)
-            #Visual feedback
-            print('.', end='')
-            sys.stdout.flush()
-    
+        print('Waiting for authorisation...', end='')
+        #Wait on the event set_token signals, instead of polling
+        #the token is then received at network latency, not poll granularity
+        try:
+            await asyncio.wait_for(_token_event.wait(), timeout=timeout_seconds)
+        except (asyncio.TimeoutError) as e:
+            pass
+
         if not token_data:
             await stop_server()
             raise(Exception("Timed out awaiting access token! "))
@@ -607,13 +675,16 @@ async def connect(config=None, mode='iframe', timeout_seconds=30, scope=""):
 
         access_token = token_data['access_token']
 
-        await stop_server()
+        #Leave the listener running - _serve() reuses it (and its port) on
+        #the next connect() call; it is only torn down on timeout above or
+        #by an explicit stop_server()
     else:
         print('Already have a valid token')
 
 async def stop_server():
     """Stop the server
-    Called automatically upon recieving token except in case of timeout
+    Called automatically on auth timeout, or manually to force a fresh
+    listener instance on the next connect()
     """
     global _server, port
     await _server.close_all_connections()
@@ -621,6 +692,20 @@ async def stop_server():
     _server = None
     port = None
 
+@functools.lru_cache(maxsize=None)
+def _load_qrcode():
+    """
+    Import the qrcode module on first use, returns None if not installed
+
+    Deferred because qrcode pulls in PIL (~100ms+ cold) and the import
+    shouldn't delay showing the login code/link to the user
+    """
+    try:
+        import qrcode
+        return qrcode
+    except (ImportError) as e:
+        return None
+
 def device_connect(config=None, qrcode=True, browser=False, scope=""):
     """
     Authenticate with the OAuth2 id provider using the device auth flow
@@ -672,16 +757,6 @@ def device_connect(config=None, qrcode=True, browser=False, scope=""):
     if scope is not None:
         settings["api_scope"] += " " + scope
 
-    if qrcode:
-        #Disable qrcode if module not installed
-        try:
-            import io
-            import qrcode
-            from PIL import Image
-        except (ImportError) as e:
-            qrcode = False
-            pass
-
     headers = {
         "content-type": "application/x-www-form-urlencoded",
     }
@@ -692,7 +767,7 @@ def device_connect(config=None, qrcode=True, browser=False, scope=""):
     }
 
     AUTH_DOMAIN = settings['api_authurl']
-    response = requests.post(f"{AUTH_DOMAIN}/oauth/device/code", headers=headers, data=data)
+    response = _session.post(f"{AUTH_DOMAIN}/oauth/device/code", headers=headers, data=data)
     if response.status_code >= 500 or "error" in response.json():
         print(response.json())
         return
@@ -701,14 +776,20 @@ def device_connect(config=None, qrcode=True, browser=False, scope=""):
     user_code = response.json()["user_code"]
     verify_url = response.json()["verification_uri_complete"]
     device_code = response.json()["device_code"]
+    #Poll at the interval the provider requests (default 5s per RFC 8628)
+    interval = response.json().get("interval", 5)
     if is_notebook():
         from IPython.display import display, HTML
 
+        #Show the code and link immediately, then render the QR image in the
+        #background so image generation doesn't delay the user acting on them
         display(f"Click link below to authenticate (verify code={user_code})")
         display(HTML(f'<h1>{user_code}</h1><a href="{verify_url}" target="_blank">{verify_url}</a>'))
-        if qrcode:
-            qr = qrcode.make(verify_url, box_size=5)
-            display(qr)
+        if qrcode and _load_qrcode():
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            future = pool.submit(_load_qrcode().make, verify_url, box_size=5)
+            future.add_done_callback(lambda f: display(f.result()))
+            pool.shutdown(wait=False)
     else:
         print(f"Click or copy link below to authenticate (verify code={user_code})")
         print(" _______________ ")
@@ -716,8 +797,8 @@ def device_connect(config=None, qrcode=True, browser=False, scope=""):
         print('|   \033[1m' + user_code + '\033[0m   |')
         print("|_______________|\n")
         print(verify_url)
-        if qrcode:
-            qr = qrcode.QRCode()
+        if qrcode and _load_qrcode():
+            qr = _load_qrcode().QRCode()
             qr.add_data(verify_url)
             qr.print_ascii()
 
@@ -735,10 +816,10 @@ def device_connect(config=None, qrcode=True, browser=False, scope=""):
     }
 
     logged_in = False
-    token = {}
     while not logged_in:
-        time.sleep(2)
-        token = requests.post(f"{AUTH_DOMAIN}/oauth/token", headers=headers2, data=data2)
+        time.sleep(interval)
+        token = _session.post(f"{AUTH_DOMAIN}/oauth/token", headers=headers2, data=data2)
+        token_json = token.json()
         if token.status_code == 200:
             if is_notebook():
                 from IPython.display import display
@@ -746,8 +827,10 @@ def device_connect(config=None, qrcode=True, browser=False, scope=""):
                 display(f"Successfully authenticated!")
             else:
                 print("Successfully authenticated!")
-                logged_in = True
-        token_json = token.json()
+            logged_in = True
+        elif token_json.get("error") == "slow_down":
+            #Provider asked us to back off, double the delay (capped)
+            interval = min(interval * 2, 10)
         if "access_token" in token_json:
             access_token = token_json["access_token"]
             break
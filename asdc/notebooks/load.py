@@ -19,17 +19,19 @@ asdc.selected
 
 # +
 task_j = asdc.call_api(f'/projects/{project}/tasks/{task}').json()
-available_assets = task_j['available_assets']
+#Use a set so the membership filter below is O(1) per option
+available_assets = frozenset(task_j['available_assets'])
 
 import ipywidgets as widgets
 
-options=[("Orthophoto", 'orthophoto.tif'),
+#The full list of known asset types, filtered by availability below
+ASSET_OPTIONS = [("Orthophoto", 'orthophoto.tif'),
          ("Surface Model", 'dsm.tif'),
          ("Point Cloud", 'georeferenced_model.laz'),
          ("Textured Model", 'textured_model.zip'),
          ("Textured Model (gLTF)", 'textured_model.glb'),
         ]
-options = [o for o in options if o[1] in available_assets]
+options = [o for o in ASSET_OPTIONS if o[1] in available_assets]
 
 filesel = widgets.Dropdown(
     options=options,
@@ -51,9 +53,18 @@ from IPython.display import display, HTML
 if '.tif' in filename or '.png' in filename or '.jpg' in filename:
     from PIL import Image
     im = Image.open(filename)
-    if im.mode != 'RGB':
+    #For JPEGs let libjpeg downsample during decode rather than
+    #decoding the full resolution image first
+    im.draft('RGB', (350,350))
+    #Palette/bilevel images silently fall back to NEAREST in thumbnail(),
+    #convert those first so they still get LANCZOS resampling
+    if im.mode in ('P', '1'):
         im = im.convert('RGB')
     im.thumbnail((350,350),Image.LANCZOS)
+    #Other modes convert after downsizing so we copy 350px not full-res,
+    #and only when the mode actually needs changing
+    if im.mode not in ('RGB', 'RGBA'):
+        im = im.convert('RGB')
     display(im)
 # -
 
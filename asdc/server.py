@@ -3,17 +3,36 @@ Server extensions for jupyterhub
 Experimental server flow additions
 - Authorization Code Flow with Proof Key for Code Exchange (PKCE)
 """
+import tornado.gen
+import tornado.httpserver
 import tornado.ioloop
 import tornado.web
 import tornado.httpclient
 import tornado.httputil
+import functools
 import sys
 import os
+import random
 import re
 from slugify import slugify
-import datetime
+import time
 import json
+#Faster JSON rendering if available, stdlib fallback otherwise
+#(the two libraries differ in signature so wrap the call sites)
+try:
+    import orjson
+    def _json_pretty(data):
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    def _json_bytes(data):
+        return orjson.dumps(data)
+except (ImportError) as e:
+    def _json_pretty(data):
+        return json.dumps(data, indent=2)
+    def _json_bytes(data):
+        return json.dumps(data).encode()
+import jwt
 import requests
+from requests.adapters import HTTPAdapter
 
 #Debug logging
 from tornado.log import enable_pretty_logging
@@ -23,8 +42,19 @@ logger = logging.getLogger("asdc-server")
 
 from pathlib import Path
 from . import utils
+import shutil
 import subprocess
 
+#Sample notebooks shipped with the package, resolved and scanned once -
+#they can't change while the server runs
+_NOTEBOOKS_DIR = Path(__file__).resolve().parent / 'notebooks'
+_NOTEBOOKS_CONTENT = [(e.name, e.path) for e in os.scandir(_NOTEBOOKS_DIR)]
+
+#Precompiled splitters for query string parsing (same patterns as utils)
+_PROJECT_SPLIT = re.compile(r'\W+')
+_TASK_SPLIT = re.compile(r'[, ]+')
+_REDIRECTS = re.compile(r'&redirects=\d')
+
 #prefix = os.getenv('JUPYTERHUB_SERVICE_PREFIX')
 #user = os.getenv('JUPYTERHUB_USER')
 baseurl = os.getenv('JUPYTERHUB_URL')
@@ -60,18 +90,25 @@ root_doc = """
 </html>
 """
 
-class RootHandler(tornado.web.RequestHandler):
+#The unauthenticated landing page never changes, render and encode it once
+#rather than formatting + utf-8 encoding on every hit
+_ROOT_UNAUTH_HTML = root_doc.format(EXTRA=f"(you are not authenticated with the API)<br><a href='{redirected}/asdc/redirect?path=nowhere'>Authenticate</a>").encode('utf-8')
+
+class StaticPageHandler(tornado.web.RequestHandler):
+    def compute_etag(self):
+        #Small generated pages, not worth the md5 over the body per response
+        return None
+
+class RootHandler(StaticPageHandler):
     def get(self):
         tokens = self.application.tokens
         if tokens:
-            #Show ID token data
-            import jwt
-            id_jwt = tokens.get("id_token")
-            decoded = jwt.decode(id_jwt, options={"verify_signature": False}) # works in PyJWT >= v2.0
+            #Show ID token data (decoded once when the tokens were stored)
+            decoded = self.application.decoded_id
             pic = decoded["picture"]
-            self.write(root_doc.format(EXTRA="You are authenticated with the API:<br><pre>" + json.dumps(decoded, indent=2) + f'</pre><img src="{pic}" width="120">'))
+            self.finish(root_doc.format(EXTRA="You are authenticated with the API:<br><pre>" + _json_pretty(decoded) + f'</pre><img src="{pic}" width="120">'))
         else:
-            self.write(root_doc.format(EXTRA=f"(you are not authenticated with the API)<br><a href='{redirected}/asdc/redirect?path=nowhere'>Authenticate</a>"))
+            self.finish(_ROOT_UNAUTH_HTML)
 
 import_doc = """
 <!DOCTYPE html>
@@ -115,7 +152,7 @@ nowhere_doc = """
 </body>
 
 </html>
-"""
+""".encode('utf-8') #Static page, pre-encoded once
 
 ################################################################################################################
 #Using PKCE to avoid storing client secret
@@ -124,7 +161,6 @@ provider_url = os.getenv('JUPYTER_OAUTH2_AUTH_PROVIDER_URL', '')
 client_id =  os.getenv('JUPYTER_OAUTH2_API_CLIENT_ID', '') #Must use the API client id, not the regular webapp id
 scope = 'openid profile email offline_access' #offline_access scope added for refresh token
 audience = os.getenv('JUPYTER_OAUTH2_API_AUDIENCE', 'https://asdc.cloud.edu.au/api')
-state = audience + server + str(int(datetime.datetime.utcnow().timestamp())) # seconds have been converted to integers
 callback_uri = f'{baseurl}{fullurl}asdc/callback'
 
 # using requests implementation
@@ -150,29 +186,53 @@ class OAuth2SessionProxy(OAuth2Session):
     )
 
 from authlib.common.security import generate_token
-# remember to save this nonce for verification
-#nonce = generate_token()
-code_verifier = generate_token(48)
 from authlib.oauth2.rfc7636 import create_s256_code_challenge
-code_challenge = create_s256_code_challenge(code_verifier)
 #client.create_authorization_url(url, redirect_uri='xxx', nonce=nonce, ...)
-client = OAuth2SessionProxy(client_id, scope=scope, redirect_uri=callback_uri, audience=audience) #, code_challenge_method='S256') #, nonce=nonce, state=env.get("APP_SECRET_KEY"))
+#Single shared client, reused by all handlers so the underlying urllib3
+#pool keeps the TLS connection to the token endpoint alive between calls
+#(a fresh session per request costs a full TLS handshake each time)
+_token_client = OAuth2SessionProxy(client_id, scope=scope, redirect_uri=callback_uri, audience=audience) #, code_challenge_method='S256') #, nonce=nonce, state=env.get("APP_SECRET_KEY"))
+_token_client.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
 
 authorization_endpoint = f'{provider_url}/authorize'
-#uri, state = client.create_authorization_url(authorization_endpoint, nonce=nonce)
-#uri, state = client.create_authorization_url(authorization_endpoint, code_verifier=code_verifier)
-auth_uri, state = client.create_authorization_url(authorization_endpoint, code_challenge=code_challenge, code_challenge_method='S256', state=state)
-#(Use state to verify later)
+#The PKCE verifier/challenge/state are generated per auth flow in
+#ServerApplication.begin_auth rather than once at import, so concurrent
+#logins each verify against their own state
+
 ################################################################################################################
 
+#In-flight requirement installs keyed by directory, so concurrent requests
+#for the same pipeline share a single pip invocation instead of racing
+_installs = {}
+
+#Use the uv resolver when available - much faster installs and no python
+#interpreter spin-up - detected once at startup, pip as the fallback
+_UV = shutil.which('uv')
+
 class RequirementsHandler(tornado.web.RequestHandler):
-    def get(self):
+    async def get(self):
         #Install requirements.txt for a pipeline
         path = self.get_argument('path')
         redirect = self.get_argument('next', '/lab/tree/')
 
-        if os.path.exists(Path.home() / path / "requirements.txt"):
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"], cwd=str(Path.home() / path))
+        #Build the paths once, one existence check instead of rebuilding
+        #Path objects for the check and the cwd separately
+        cwd = os.path.join(os.path.expanduser("~"), path)
+        if os.path.exists(os.path.join(cwd, "requirements.txt")):
+            future = _installs.get(cwd)
+            if future is None:
+                if _UV:
+                    #Target the running interpreter's environment, as pip would
+                    cmd = [_UV, "pip", "install", "-r", "requirements.txt", "--python", sys.executable]
+                else:
+                    cmd = [sys.executable, "-m", "pip", "install", "-r", "requirements.txt"]
+                #Run the blocking install on a worker thread, check_call
+                #previously froze the whole server for its duration
+                future = tornado.ioloop.IOLoop.current().run_in_executor(
+                    None, functools.partial(subprocess.check_call, cmd, cwd=cwd))
+                _installs[cwd] = future
+                future.add_done_callback(lambda f: _installs.pop(cwd, None))
+            await future
 
         return self.redirect(redirect)
 
@@ -186,59 +246,73 @@ class RedirectHandler(tornado.web.RequestHandler):
     - user is redirected to the Auth0 login url, with redirect back to /callback
     - if PATH set in /callback, then redirect there after storing the access_token
     """
-    def get(self):
+    async def get(self):
         logger.info("Handling redirect")
-        projects = [int(p) for p in list(filter(None, re.split('\W+', self.get_argument('projects', ''))))]
-        tasks = list(filter(None, re.split('[, ]+', self.get_argument('tasks', ''))))
-        redirect = self.get_argument('path', '')
+        #Read the raw arguments dict once rather than paying get_argument's
+        #per-call lookup and unicode validation for each parameter
+        args = self.request.arguments
+        projects = [int(p) for p in _PROJECT_SPLIT.split(args.get('projects', [b''])[0].decode()) if p]
+        tasks = [t for t in _TASK_SPLIT.split(args.get('tasks', [b''])[0].decode()) if t]
+        redirect = args.get('path', [b''])[0].decode()
         #Save the redirect path and begin the auth flow
         if redirect == 'nowhere':
-            self.application.redirect_path = ""
+            redirect_path = ""
         else:
-            self.application.redirect_path = f"{redirected}lab/tree/{redirect}"
+            redirect_path = f"{redirected}lab/tree/{redirect}"
         print(projects,tasks,redirect)
 
         #utils.write_inputs(projects=projects, tasks=tasks, port=sys.argv[1])
-        utils.write_inputs(projects=projects, tasks=tasks)
+        #File IO on a worker thread, a slow/FUSE-backed home dir would
+        #otherwise stall the whole IOLoop
+        await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, functools.partial(utils.write_inputs, projects=projects, tasks=tasks))
 
         #return self.redirect(f"{fullurl}lab/tree/{redirect}")
-        return self.redirect(auth_uri)
+        return self.redirect(self.application.begin_auth(redirect_path))
 
-class ImportHandler(tornado.web.RequestHandler):
-    def get(self):
+class ImportHandler(StaticPageHandler):
+    async def get(self):
         #Write a python module to import the selected task
         if not 'access_token' in self.application.tokens:
             #Redirect to authorise, then return here
             redirect = self.request.uri.rsplit('/', 1)[-1]
-            self.application.redirect_path = f"{redirected}asdc/{redirect}"
             #Remove the redirects= counter
-            self.application.redirect_path = re.sub(r'&redirects=\d', '', self.application.redirect_path)
-            logger.info(f"No tokens, redirecting, orig url: {self.request.uri} : return: {self.application.redirect_path}")
-            return self.redirect(auth_uri)
+            redirect_path = _REDIRECTS.sub('', f"{redirected}asdc/{redirect}")
+            logger.info(f"No tokens, redirecting, orig url: {self.request.uri} : return: {redirect_path}")
+            return self.redirect(self.application.begin_auth(redirect_path))
 
         logger.info("Handling import")
-        project = self.get_argument('project')
-        task = self.get_argument('task')
-        taskname = slugify(self.get_argument('name'))
-        asset = self.get_argument('asset', 'orthophoto.tif')
-        redirect = self.get_argument('redirect', 'yes')
-
-        #Write input data to a file
-        destdir = Path.home() / taskname
-        destdir.mkdir(parents=True, exist_ok=True)
-        with open(str(destdir / 'input.json'), 'w') as f:
-            data = {"project" : project, "task" : task, "task_name" : taskname, "asset": asset}
-            json.dump(data, f)
-
-        # Create links to sample notebooks
-        srcfile = Path(__file__)
-        srcdir = srcfile.parents[0] / 'notebooks'
-        for path in srcdir.iterdir():
-            dest = destdir / path.name
-            if not dest.exists():
-                os.symlink(path, dest)
-
-        utils.write_inputs(projects=[project], tasks=[task])
+        #Single raw arguments read, as in RedirectHandler
+        args = self.request.arguments
+        try:
+            project = args['project'][0].decode()
+            task = args['task'][0].decode()
+            taskname = slugify(args['name'][0].decode())
+        except (KeyError) as e:
+            raise tornado.web.HTTPError(status_code=400, reason=f"Missing argument {e}")
+        asset = args.get('asset', [b'orthophoto.tif'])[0].decode()
+        redirect = args.get('redirect', [b'yes'])[0].decode()
+
+        def write_files():
+            #Write input data to a file
+            destdir = Path.home() / taskname
+            destdir.mkdir(parents=True, exist_ok=True)
+            with open(str(destdir / 'input.json'), 'wb') as f:
+                data = {"project" : project, "task" : task, "task_name" : taskname, "asset": asset}
+                f.write(_json_bytes(data))
+
+            # Create links to sample notebooks
+            #(source listing cached at module load, one listdir here)
+            dest_names = set(os.listdir(destdir))
+            for name, src in _NOTEBOOKS_CONTENT:
+                if name not in dest_names:
+                    os.symlink(src, destdir / name)
+
+            utils.write_inputs(projects=[project], tasks=[task])
+
+        #All the file IO in one executor hop, keeps the IOLoop responsive
+        #(mkdir/symlink can fault into slow FUSE on jupyterhub deployments)
+        await tornado.ioloop.IOLoop.current().run_in_executor(None, write_files)
 
         script = ""
         if redirect == 'yes':
@@ -246,10 +320,10 @@ class ImportHandler(tornado.web.RequestHandler):
             return self.redirect(f"{redirected}lab/tree/{taskname}/load.py")
         else:
             #self.write(import_doc.format(FN=filename, script=script))
-            return self.write(import_doc.format(FN=filename, script=""))
+            return self.finish(import_doc.format(FN=filename, script=""))
 
 class TokensHandler(tornado.web.RequestHandler):
-    def get(self):
+    async def get(self):
         logger.info("Handling tokens")
         tokens = self.application.tokens
         if not tokens:
@@ -259,25 +333,20 @@ class TokensHandler(tornado.web.RequestHandler):
                 reason="Tokens are not available."
             )
 
-        #Return the token data
-        import jwt
-        id_jwt = tokens.get("id_token")
-        decoded = jwt.decode(id_jwt, options={"verify_signature": False}) # works in PyJWT >= v2.0
-        id_token = decoded
-
         #Check if it is expired, renew expired token
-        dt = datetime.datetime.fromtimestamp(tokens['expires_at'])
-        now = datetime.datetime.now(tz=None)
-        if dt <= now:
+        #(plain float comparison against the cached deadline, which already
+        # carries the 30 second safety margin)
+        if time.time() >= self.application.expires_at:
             logger.info("Token expired")
             #Use refresh_token to get new token if necessary
             token_endpoint = f'{provider_url}/oauth/token'
             rtoken = tokens["refresh_token"]
             try:
-                #Need to create new client
-                client = OAuth2SessionProxy(client_id, scope=scope, redirect_uri=callback_uri, audience=audience)
-                new_tokens = client.refresh_token(token_endpoint, refresh_token=rtoken)
+                #Refresh on a worker thread, same as the callback fetch
+                new_tokens = await tornado.ioloop.IOLoop.current().run_in_executor(
+                    None, functools.partial(_token_client.refresh_token, token_endpoint, refresh_token=rtoken))
                 logger.info(f"New tokens recieved")
+                self.application.store_tokens(new_tokens)
                 tokens = new_tokens
             except (Exception) as e:
                 #Just return the original tokens
@@ -286,41 +355,61 @@ class TokensHandler(tornado.web.RequestHandler):
 
         self.write(tokens)
 
-class CallbackHandler(tornado.web.RequestHandler):
-    def get(self):
+class CallbackHandler(StaticPageHandler):
+    async def get(self):
         #NEW HANDLER - Authorization Code Flow with PKCE
         authorization_response = self.request.uri
         logger.info("/callback")
+        #Look up the pending flow by the state echoed back from the provider
+        state = self.get_argument('state', '')
+        pending = self.application.pending_auth.pop(state, None)
+        if pending is None:
+            logger.error("Callback with unknown auth state")
+            raise tornado.web.HTTPError(status_code=400, reason="Unknown authorization state.")
         token_endpoint = f'{provider_url}/oauth/token'
         #This gets the token using auth code flow
         #THIS SOMETIMES ERRORS WITH http.client.RemoteDisconnected: Remote end closed connection without response
         #https://github.com/requests/requests-oauthlib/blob/master/requests_oauthlib/oauth2_session.py#L191
+        #Run the blocking token fetch on a worker thread so the IOLoop
+        #can keep serving other handlers during the round trip to Auth0
+        loop = tornado.ioloop.IOLoop.current()
         retries = 5
         for i in range(retries):
             try:
-                client = OAuth2SessionProxy(client_id, scope=scope, redirect_uri=callback_uri, audience=audience)
-                tokens = client.fetch_token(token_endpoint, authorization_response=authorization_response, code_verifier=code_verifier, state=state)
+                tokens = await loop.run_in_executor(None, functools.partial(
+                    _token_client.fetch_token, token_endpoint,
+                    authorization_response=authorization_response,
+                    code_verifier=pending["verifier"], state=state))
                 break
             except (requests.exceptions.ConnectionError) as e:
                 logger.info(f"Exception in client.fetch_token: {e} retry # {i}")
-                pass
-        self.application.tokens = tokens #Store on application
+                #Exponential backoff with jitter, the flat delay hammered a
+                #struggling endpoint with retries at a fixed rate
+                await tornado.gen.sleep(0.1 * (2 ** i) + random.random() * 0.05)
+        self.application.store_tokens(tokens) #Store on application (caches decoded claims + expiry)
 
         #Re-write the input data, now include the server port to access tokens with
-        utils.write_port(sys.argv[1])
+        await loop.run_in_executor(None, utils.write_port, sys.argv[1])
 
-        if len(self.application.redirect_path) == 0:
+        if len(pending["redirect"]) == 0:
             logger.info(f"Redirect set to nowhere")
-            self.write(nowhere_doc)
+            self.finish(nowhere_doc)
         else:
-            logger.info(f"Redirecting: {self.application.redirect_path}")
-            return self.redirect(self.application.redirect_path)
+            logger.info(f"Redirecting: {pending['redirect']}")
+            return self.redirect(pending["redirect"])
 
 class ServerApplication(tornado.web.Application):
 
     def __init__(self):
-        self.redirect_path = "/";
         self.tokens = {};
+        #Pending PKCE flows keyed by state, each holds its own verifier and
+        #return path so concurrent logins don't share module globals
+        self.pending_auth = {}
+        #Derived token state, cached so handlers don't re-decode the JWT
+        #or rebuild expiry objects on every request
+        self.decoded_id = None
+        self.expires_at = 0
+        self.refresh_timer = None
 
         handlers = [
             (r"/", RootHandler),
@@ -329,12 +418,77 @@ class ServerApplication(tornado.web.Application):
             (r"/tokens", TokensHandler),
             (r"/callback", CallbackHandler)
         ]
-        settings = dict() #your application settings here
+        #gzip the HTML/JSON responses, they compress to a fraction of the size
+        settings = dict(compress_response=True)
         super().__init__(handlers, **settings)
 
+    def begin_auth(self, redirect_path):
+        #Start a fresh PKCE flow: new verifier/challenge/state per login
+        now = time.time()
+        #Expire flows the user abandoned (never hit the callback) so the
+        #table can't grow without bound on a long-running server
+        stale = [s for s, p in self.pending_auth.items() if now - p["ts"] > 600]
+        for s in stale:
+            del self.pending_auth[s]
+        code_verifier = generate_token(48)
+        code_challenge = create_s256_code_challenge(code_verifier)
+        state = audience + server + str(int(now)) + generate_token(16)
+        self.pending_auth[state] = {"verifier": code_verifier, "redirect": redirect_path, "ts": now}
+        auth_uri, state = _token_client.create_authorization_url(
+            authorization_endpoint, code_challenge=code_challenge,
+            code_challenge_method='S256', state=state)
+        return auth_uri
+
+    def store_tokens(self, tokens):
+        #Store new tokens and cache the derived values the handlers need
+        self.tokens = tokens
+        #Decode the id token claims once here instead of per request
+        self.decoded_id = jwt.decode(tokens.get("id_token"), options={"verify_signature": False}) # works in PyJWT >= v2.0
+        #Expiry deadline with a 30 second safety margin
+        self.expires_at = tokens['expires_at'] - 30
+
+        #Schedule a proactive refresh shortly before expiry so requests
+        #never pay the token-endpoint round trip inline
+        #(the expired-token branch in TokensHandler remains as a fallback)
+        if tokens.get("refresh_token"):
+            loop = tornado.ioloop.IOLoop.current()
+            if self.refresh_timer:
+                loop.remove_timeout(self.refresh_timer)
+            delay = max(tokens.get('expires_in', tokens['expires_at'] - time.time()) - 60, 60)
+            self.refresh_timer = loop.call_later(delay, self._refresh)
+
+    async def _refresh(self):
+        #Background refresh, runs on the IOLoop shortly before token expiry
+        self.refresh_timer = None
+        rtoken = self.tokens.get("refresh_token")
+        if not rtoken:
+            return
+        token_endpoint = f'{provider_url}/oauth/token'
+        try:
+            new_tokens = await tornado.ioloop.IOLoop.current().run_in_executor(
+                None, functools.partial(_token_client.refresh_token, token_endpoint, refresh_token=rtoken))
+            logger.info("Tokens refreshed in background")
+            self.store_tokens(new_tokens)
+        except (Exception) as e:
+            #On failure keep the old tokens, TokensHandler will retry on demand
+            logger.error(f"Background token refresh failed: {e}")
+
 if __name__ == "__main__":
+    #Use the faster libuv-backed event loop if available
+    #(tornado 6 runs on whichever asyncio loop policy is active)
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+            uvloop.install()
+        except (ImportError) as e:
+            pass
+
     print("Starting OAuth2 callback server", sys.argv)
     app = ServerApplication()
-    app.listen(sys.argv[1])
+    #xheaders so client addresses survive the jupyter-server-proxy hop,
+    #explicit backlog to absorb connection bursts
+    http_server = tornado.httpserver.HTTPServer(app, xheaders=True)
+    http_server.bind(int(sys.argv[1]), backlog=128)
+    http_server.start()
     tornado.ioloop.IOLoop.current().start()
 
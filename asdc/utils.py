@@ -5,6 +5,7 @@
 
 """
 
+import functools
 import logging
 logger = logging.getLogger('app.logger')
 import json
@@ -41,10 +42,14 @@ class ExecutionPaused(Exception):
         ipython.showtraceback = self.default_traceback
 
 
+@functools.lru_cache(maxsize=1)
 def is_notebook():
     """
     Detects if running within an interactive IPython notebook environment
 
+    The result is cached - the environment doesn't change within a process
+    and this is called repeatedly from the auth and transfer paths
+
     Returns
     -------
     boolean
@@ -151,10 +156,14 @@ def resize_image(image_path, resize_to, done=None):
     return retval
 
 
+#Precompiled splitters for the task/project env var lists
+_TASK_SPLIT = re.compile(r'[, ]+')
+_PROJECT_SPLIT = re.compile(r'\W+')
+
 def default_inputs():
     #Get default inputs from env
-    tasks = list(filter(None, re.split('[, ]+', os.getenv("ASDC_TASKS", ""))))
-    projects = [int(p) for p in list(filter(None, re.split('\W+', os.getenv("ASDC_PROJECTS", ""))))]
+    tasks = [t for t in _TASK_SPLIT.split(os.getenv("ASDC_TASKS", "")) if t]
+    projects = [int(p) for p in _PROJECT_SPLIT.split(os.getenv("ASDC_PROJECTS", "")) if p]
     return {"projects" : projects, "tasks" : tasks, "port" : None}
 
 def write_inputs(tasks=[], projects=[], port=None):